@@ -1,18 +1,605 @@
 import insightface
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import face_align
+import copy
 import cv2
 import numpy as np
+import onnxruntime
+import os
+import json
+import stat
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from deep_sort_realtime.deepsort_tracker import DeepSort
 from sklearn.metrics.pairwise import cosine_similarity
 from datetime import datetime, timedelta
+from functools import lru_cache
 
-from typing import Type
+from typing import Callable, Literal, Optional, Type
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
+# The FaceAnalysis model is loaded once per process and shared by every scan.
+# ONNX Runtime sessions are safe to call from several threads, so scans only
+# need their own tracker and results (see ScanSession).
+_shared_app = None
+_shared_app_lock = threading.Lock()
+
+def get_face_analysis():
+    """
+    Return the process-wide FaceAnalysis model, loading it on first use.
+
+    Concurrent scans share each model's ONNX Runtime intra-op thread pool, which
+    defaults to one thread per core. When running N scans at once, set
+    SPOTLIGHT_ORT_THREADS to about (cores / N) so the scans don't oversubscribe
+    the CPU.
+    """
+    global _shared_app
+    with _shared_app_lock:
+        if _shared_app is None:
+            app = FaceAnalysis(allowed_modules=['detection', 'recognition'], providers=['CPUExecutionProvider'])
+            intra_op_threads = int(os.getenv("SPOTLIGHT_ORT_THREADS", "0"))
+            if intra_op_threads > 0:
+                # insightface doesn't pass session options through, so recreate the sessions
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = intra_op_threads
+                for model in app.models.values():
+                    model.session = onnxruntime.InferenceSession(
+                        model.model_file, sess_options=options, providers=['CPUExecutionProvider']
+                    )
+            app.prepare(ctx_id=0, det_size=(640, 640))
+            _shared_app = app
+    return _shared_app
+
+def format_timedelta(td):
+    """Convert timedelta to HH:MM:SS format"""
+    total_seconds = int(td.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+def print_event(event):
+    """Print a live appearance event as soon as it happens"""
+    if event['event'] == 'start':
+        print(f"Track {event['track_id']} appeared at {event['start_time']}", flush=True)
+    else:
+        print(f"Track {event['track_id']} left at {event['end_time']} "
+              f"(on screen for {event['duration']})", flush=True)
+
+def frame_time(frame_idx, fps):
+    """Presentation time of a 0-based frame index; every mode reports times this way"""
+    return timedelta(seconds=frame_idx / fps)
+
+def format_appearances(appearances, thumbnails=None):
+    """Format appearances by track_id as the text returned by RecogniseTool"""
+    thumbnails = thumbnails or {}
+    result = "Appearance Times:\n"
+    for track_id, track_appearances in appearances.items():
+        result += f"\nTrack ID: {track_id}\n"
+        if track_id in thumbnails:
+            result += f"Thumbnail: {thumbnails[track_id]}\n"
+        for idx, appearance in enumerate(track_appearances, 1):
+            result += f"Appearance {idx}:\n"
+            result += f"  Start Time: {appearance['start_time']}\n"
+            result += f"  End Time: {appearance['end_time']}\n"
+            result += f"  Duration: {appearance['duration']}\n"
+    return result
+
+def write_results(tracks, output_dir):
+    """Write per-track results to appearances.json in output_dir and return its path"""
+    results_path = os.path.join(output_dir, "appearances.json")
+    with open(results_path, "w") as f:
+        json.dump({str(track_id): entry for track_id, entry in tracks.items()}, f, indent=2)
+    return results_path
+
+def prepare_frame(frame):
+    """Rotate and downscale a raw video frame before detection"""
+    frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
+
+    # Resize frame for better detection
+    scale_percent = 50
+    width = int(frame.shape[1] * scale_percent / 100)
+    height = int(frame.shape[0] * scale_percent / 100)
+    return cv2.resize(frame, (width, height))
+
+def crop_face(frame, bbox, margin=0.2):
+    """Crop a face out of a frame with some margin, clipped to the frame"""
+    x1, y1, x2, y2 = bbox[:4]
+    pad_x = (x2 - x1) * margin
+    pad_y = (y2 - y1) * margin
+    x1, y1 = max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y))
+    x2, y2 = min(frame.shape[1], int(x2 + pad_x)), min(frame.shape[0], int(y2 + pad_y))
+    return frame[y1:y2, x1:x2]
+
+def face_quality(face, crop):
+    """
+    Score a detected face in [0, 1] as detection score x face size x sharpness.
+
+    Size saturates at a 112px face (the recogniser's input size) and sharpness
+    (variance of the Laplacian) at 100, so each term is comparable across videos.
+    """
+    if crop.size == 0:
+        return 0.0
+    x1, y1, x2, y2 = face.bbox[:4]
+    size = min(1.0, np.sqrt(max(0.0, (x2 - x1) * (y2 - y1))) / 112.0)
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    sharpness = min(1.0, cv2.Laplacian(gray, cv2.CV_64F).var() / 100.0)
+    return float(face.det_score) * size * sharpness
+
+def bbox_iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def detect_faces(app, frame):
+    """Run only the detector of a FaceAnalysis model; the faces have no embedding yet"""
+    return _detect_with(app.det_model, frame)
+
+def _detect_with(det_model, frame):
+    bboxes, kpss = det_model.detect(frame, max_num=0, metric='default')
+    faces = []
+    for i in range(bboxes.shape[0]):
+        kps = kpss[i] if kpss is not None else None
+        faces.append(Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+    return faces
+
+@lru_cache(maxsize=None)
+def _has_dynamic_batch(det_model):
+    """Whether the detector was exported with a dynamic batch axis (the stock det_10g's is fixed at 1)"""
+    return not isinstance(det_model.session.get_inputs()[0].shape[0], int)
+
+def _letterbox(det_model, frame):
+    """Resize a frame into the detector's input size as SCRFD.detect does"""
+    input_size = det_model.input_size
+    im_ratio = float(frame.shape[0]) / frame.shape[1]
+    model_ratio = float(input_size[1]) / input_size[0]
+    if im_ratio > model_ratio:
+        new_height = input_size[1]
+        new_width = int(new_height / im_ratio)
+    else:
+        new_width = input_size[0]
+        new_height = int(new_width * im_ratio)
+    det_img = np.zeros((input_size[1], input_size[0], 3), dtype=np.uint8)
+    det_img[:new_height, :new_width, :] = cv2.resize(frame, (new_width, new_height))
+    return det_img
+
+class _PrecomputedSession:
+    """Stands in for a detector's ONNX session, returning outputs already computed for one frame"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def run(self, output_names, input_feed):
+        return self.outputs
+
+def detect_faces_batch(app, frames):
+    """
+    Run the detector once over a batch of frames and split the faces back out per frame.
+
+    Needs a detector exported with a dynamic batch axis; otherwise the frames are
+    detected one at a time. Each frame's share of the outputs is decoded by the
+    detector's own detect(), so the faces are the same as from detect_faces.
+    """
+    det_model = app.det_model
+    if len(frames) == 1 or det_model.input_size is None or not _has_dynamic_batch(det_model):
+        return [detect_faces(app, frame) for frame in frames]
+
+    blob = cv2.dnn.blobFromImages(
+        [_letterbox(det_model, frame) for frame in frames], 1.0 / det_model.input_std,
+        tuple(det_model.input_size), (det_model.input_mean, det_model.input_mean, det_model.input_mean),
+        swapRB=True
+    )
+    net_outs = det_model.session.run(det_model.output_names, {det_model.input_name: blob})
+
+    n = len(frames)
+    if det_model.batched:
+        per_frame = [[out[b:b + 1] for out in net_outs] for b in range(n)]
+    else:
+        # Unbatched exports flatten the batch into the first axis
+        per_frame = [[out.reshape((n, -1, out.shape[-1]))[b] for out in net_outs] for b in range(n)]
+
+    faces_per_frame = []
+    for frame, outputs in zip(frames, per_frame):
+        detector = copy.copy(det_model)
+        detector.session = _PrecomputedSession(outputs)
+        faces_per_frame.append(_detect_with(detector, frame))
+    return faces_per_frame
+
+def recognise_faces_batch(app, frames, faces_per_frame):
+    """Embed every face of every frame with a single recogniser call"""
+    recognition = app.models['recognition']
+    aligned = [
+        face_align.norm_crop(frame, landmark=face.kps, image_size=recognition.input_size[0])
+        for frame, faces in zip(frames, faces_per_frame)
+        for face in faces
+    ]
+    if not aligned:
+        return
+    embeddings = recognition.get_feat(aligned)
+    faces = [face for faces in faces_per_frame for face in faces]
+    for face, embedding in zip(faces, embeddings):
+        face.embedding = embedding.flatten()
+
+class RecognitionCache:
+    """
+    Reuse identities of faces that continue a box seen in the previous frame.
+
+    Detection still runs on every frame, but recognition only runs for new faces,
+    faces whose box jumped (low IoU with its constant-velocity prediction, or a
+    sharp size change), and targets that were last embedded `interval` frames ago.
+    Faces identified as non-targets are never re-embedded while they keep being
+    followed.
+    """
+
+    def __init__(self, input_embedding, similarity_threshold=0.5, interval=10,
+                 iou_threshold=0.5, max_scale_change=0.3):
+        self.input_embedding = input_embedding
+        self.similarity_threshold = similarity_threshold
+        self.interval = interval
+        self.iou_threshold = iou_threshold
+        self.max_scale_change = max_scale_change
+        # Faces of the previous frame: bbox, velocity and identity (embedding, is_target, last_embedded)
+        self.entries = []
+        self.frame_idx = 0
+
+    def _follow(self, bbox, claimed):
+        """Return the index of the previous face this box continues, or None"""
+        best, best_iou = None, self.iou_threshold
+        for i, entry in enumerate(self.entries):
+            if i in claimed:
+                continue
+            predicted = entry['bbox'] + entry['velocity']
+            iou = bbox_iou(bbox, predicted)
+            if iou < best_iou:
+                continue
+            scale = np.sqrt(((bbox[2] - bbox[0]) * (bbox[3] - bbox[1])) /
+                            max(1e-6, (predicted[2] - predicted[0]) * (predicted[3] - predicted[1])))
+            if abs(scale - 1) > self.max_scale_change:
+                continue
+            best, best_iou = i, iou
+        return best
+
+    def get(self, app, frame, faces=None):
+        """
+        Detect faces in the frame and fill in their embeddings, reusing known ones.
+
+        Already detected faces (e.g. from detect_faces_batch) can be passed in.
+        """
+        if faces is None:
+            faces = detect_faces(app, frame)
+        return self.get_batch(app, [frame], [faces])[0]
+
+    def get_batch(self, app, frames, faces_per_frame):
+        """
+        Fill in the embeddings of already detected faces in consecutive frames.
+
+        Faces are followed frame by frame as in get(), and those that need
+        recognition are embedded together in one recogniser call. The call is
+        only made early if a face embedded earlier in the batch is due again
+        and its target verdict is needed.
+        """
+        # Faces to embed, with the identity each one starts
+        pending = []
+        assigned = []
+        for frame, faces in zip(frames, faces_per_frame):
+            self.frame_idx += 1
+            entries = []
+            claimed = set()
+            for face in faces:
+                bbox = face.bbox.astype(np.float32)
+                i = self._follow(bbox, claimed)
+                previous = self.entries[i] if i is not None else None
+                if previous is not None:
+                    claimed.add(i)
+
+                identity = previous['identity'] if previous is not None else None
+                if (identity is not None and identity['is_target'] is None and
+                        self.frame_idx - identity['last_embedded'] >= self.interval):
+                    self._embed(app, pending)
+                    pending = []
+                if identity is None or (identity['is_target'] is not False and
+                                        self.frame_idx - identity['last_embedded'] >= self.interval):
+                    identity = {'embedding': None, 'is_target': None, 'last_embedded': self.frame_idx}
+                    pending.append((frame, face, identity))
+                assigned.append((face, identity))
+
+                velocity = bbox - previous['bbox'] if previous is not None else np.zeros(4, dtype=np.float32)
+                entries.append({'bbox': bbox, 'velocity': velocity, 'identity': identity})
+            self.entries = entries
+
+        self._embed(app, pending)
+        for face, identity in assigned:
+            face.embedding = identity['embedding']
+        return faces_per_frame
+
+    def _embed(self, app, pending):
+        """Embed the pending (frame, face, identity) triples in one call and settle their identities"""
+        recognise_faces_batch(app, [frame for frame, _, _ in pending], [[face] for _, face, _ in pending])
+        for _, face, identity in pending:
+            identity['embedding'] = face.embedding
+            emb = face.embedding / np.linalg.norm(face.embedding)
+            similarity = cosine_similarity([self.input_embedding], [emb])[0][0]
+            identity['is_target'] = bool(similarity > self.similarity_threshold)
+
+class LiveFrameReader:
+    """
+    Read a live source on a background thread, keeping only the newest frame.
+
+    When inference falls behind, older frames are overwritten (and counted in
+    `dropped`) instead of queueing up, so latency stays bounded. Each frame is
+    stamped with the wall-clock time it was captured.
+
+    Local regular files are paced to their frame rate and re-opened at EOF, so
+    a file that is still being appended to behaves like a stream. The reader
+    stops after `idle_timeout` seconds without a new frame, or when stop() is
+    called. If reading fails, the reader finishes and keeps the exception in
+    `error`.
+    """
+
+    def __init__(self, source, idle_timeout=10.0, poll_interval=0.2):
+        self.source = source
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.is_local_file = os.path.exists(source) and not stat.S_ISFIFO(os.stat(source).st_mode)
+        self.dropped = 0
+        self.frames_read = 0
+        self.error = None
+        self._latest = None
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._finished = False
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        # A network read can block for a while; the thread is a daemon, so don't wait forever
+        self._thread.join(timeout=5.0)
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source)
+        if self.is_local_file and self.frames_read:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, self.frames_read)
+        return cap
+
+    def _read_loop(self):
+        cap = None
+        try:
+            cap = self._open()
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            last_frame_at = time.monotonic()
+            while not self._stopped.is_set():
+                ret, frame = cap.read()
+                now = time.monotonic()
+                if not ret:
+                    if now - last_frame_at > self.idle_timeout:
+                        break
+                    # Wait for more data, then reconnect / re-open past what was read
+                    self._stopped.wait(self.poll_interval)
+                    cap.release()
+                    cap = None
+                    cap = self._open()
+                    continue
+
+                self.frames_read += 1
+                last_frame_at = now
+                with self._condition:
+                    if self._latest is not None:
+                        self.dropped += 1
+                    self._latest = (frame, now)
+                    self._condition.notify()
+
+                if self.is_local_file:
+                    self._stopped.wait(1.0 / fps)
+        except Exception as e:
+            self.error = e
+        finally:
+            if cap is not None:
+                cap.release()
+            # Always wake the consumer, however the loop ended
+            with self._condition:
+                self._finished = True
+                self._condition.notify()
+
+    def read(self, timeout=None):
+        """Wait for a new frame; return (frame, captured_at), or None on timeout or once finished"""
+        with self._condition:
+            if self._latest is None and not self._finished:
+                self._condition.wait(timeout)
+            latest, self._latest = self._latest, None
+            return latest
+
+class ScanSession:
+    """
+    State for a single scan: the tracker and the appearances it produced.
+
+    A session is created per call and never shared between threads; only the
+    FaceAnalysis model underneath it is shared.
+    """
+
+    def __init__(self, input_embedding, similarity_threshold=0.5, min_face_quality=0.0,
+                 recognition_interval=0, on_event=None):
+        self.input_embedding = input_embedding
+        self.similarity_threshold = similarity_threshold
+        # Faces scoring below this are ignored for matching
+        self.min_face_quality = min_face_quality
+        # Skip re-recognition of followed faces when an interval is given
+        self.recognition_cache = None
+        if recognition_interval > 0:
+            self.recognition_cache = RecognitionCache(
+                input_embedding, similarity_threshold, interval=recognition_interval
+            )
+        # Initialize DeepSORT Tracker. It is given the ArcFace embeddings we already
+        # have instead of loading its own MobileNet embedder for every session;
+        # its appearance gate is loosened to match ArcFace's similarity scale.
+        self.tracker = DeepSort(max_age=30, n_init=3, embedder=None,
+                                max_cosine_distance=1 - similarity_threshold)
+        # Dictionary to store appearance data for each track
+        self.appearances = {}
+        # Dictionary to store current appearance start times
+        self.current_appearances = {}
+        # Best (quality, crop) seen so far for each track
+        self.best_faces = {}
+        # Thumbnail paths written by save()
+        self.thumbnails = {}
+        # Called with a dict as each appearance starts and ends
+        self.on_event = on_event
+        # Frames skipped to keep up with a live source
+        self.dropped_frames = 0
+        self.current_time = timedelta(0)
+
+    def get_faces(self, app, frame):
+        """Detect and recognise the faces in a frame"""
+        if self.recognition_cache is not None:
+            return self.recognition_cache.get(app, frame)
+        return app.get(frame)
+
+    def get_faces_batch(self, app, frames):
+        """Detect and recognise the faces in several frames with batched inference"""
+        faces_per_frame = detect_faces_batch(app, frames)
+        if self.recognition_cache is not None:
+            return self.recognition_cache.get_batch(app, frames, faces_per_frame)
+        recognise_faces_batch(app, frames, faces_per_frame)
+        return faces_per_frame
+
+    def match_faces(self, faces, frame):
+        """
+        Turn detected faces into tracker detections for faces matching the target.
+
+        Returns the detections, their embeddings and, for each one, its (quality, crop) pair.
+        """
+        detections = []
+        embeds = []
+        candidates = []
+        for face in faces:
+            emb = face.embedding / np.linalg.norm(face.embedding)
+            similarity = cosine_similarity([self.input_embedding], [emb])[0][0]
+            if similarity <= self.similarity_threshold:
+                continue
+
+            # Only matched faces are worth scoring
+            crop = crop_face(frame, face.bbox)
+            quality = face_quality(face, crop)
+            if quality < self.min_face_quality:
+                continue
+
+            bbox = face.bbox.astype(int)
+            confidence = similarity
+            detections.append(([bbox[0], bbox[1], bbox[2]-bbox[0], bbox[3]-bbox[1]], confidence, 'face'))
+            embeds.append(emb)
+            candidates.append((quality, crop))
+        return detections, embeds, candidates
+
+    def update(self, faces, frame, current_time):
+        """Feed one frame's faces to the tracker and update appearances"""
+        self.current_time = current_time
+        detections, embeds, candidates = self.match_faces(faces, frame)
+        tracks = self.tracker.update_tracks(detections, embeds=embeds, others=candidates)
+
+        # Update appearances
+        active_tracks = set()
+
+        for track in tracks:
+            if not track.is_confirmed():
+                continue
+
+            track_id = track.track_id
+            active_tracks.add(track_id)
+
+            # Keep the best crop of this track (only set when matched this frame)
+            candidate = track.get_det_supplementary()
+            if candidate is not None:
+                best = self.best_faces.get(track_id)
+                if best is None or candidate[0] > best[0]:
+                    self.best_faces[track_id] = (candidate[0], candidate[1].copy())
+
+            # If this is a new appearance for this track
+            if track_id not in self.current_appearances:
+                self.current_appearances[track_id] = current_time
+                if track_id not in self.appearances:
+                    self.appearances[track_id] = []
+                if self.on_event is not None:
+                    self.on_event({
+                        'event': 'start',
+                        'track_id': track_id,
+                        'start_time': format_timedelta(current_time)
+                    })
+
+        # Check for tracks that have disappeared
+        for track_id in list(self.current_appearances.keys()):
+            if track_id not in active_tracks:
+                self._close_appearance(track_id, current_time)
+
+    def finish(self, end_time=None):
+        """Handle any remaining active appearances at the end of the video"""
+        end_time = self.current_time if end_time is None else end_time
+        for track_id in list(self.current_appearances.keys()):
+            self._close_appearance(track_id, end_time)
+        return self.appearances
+
+    def _close_appearance(self, track_id, end_time):
+        start_time = self.current_appearances.pop(track_id)
+        duration = end_time - start_time
+        appearance = {
+            'start_time': format_timedelta(start_time),
+            'end_time': format_timedelta(end_time),
+            'duration': format_timedelta(duration)
+        }
+        self.appearances[track_id].append(appearance)
+        if self.on_event is not None:
+            self.on_event({'event': 'end', 'track_id': track_id, **appearance})
+
+    def save(self, output_dir, thumbnail_size=160):
+        """
+        Write each track's best face as a small JPEG plus appearances.json to output_dir.
+
+        Returns the path of the JSON file.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        tracks = {}
+        for track_id, track_appearances in self.appearances.items():
+            entry = {'appearances': track_appearances}
+            if track_id in self.best_faces:
+                quality, crop = self.best_faces[track_id]
+                scale = thumbnail_size / max(crop.shape[:2])
+                if scale < 1:
+                    crop = cv2.resize(crop, (int(crop.shape[1] * scale), int(crop.shape[0] * scale)))
+                thumbnail_path = os.path.join(output_dir, f"track_{track_id}.jpg")
+                cv2.imwrite(thumbnail_path, crop, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                self.thumbnails[track_id] = thumbnail_path
+                entry['thumbnail'] = thumbnail_path
+                entry['face_quality'] = round(quality, 4)
+            tracks[track_id] = entry
+
+        return write_results(tracks, output_dir)
+
+    def format_results(self):
+        """Format the appearances as the text returned by RecogniseTool"""
+        return format_appearances(self.appearances, self.thumbnails)
+
 class RecogniseToolInput(BaseModel):
     image_path: str = Field(description="The path to the image file to be recognised")
     video_path: str = Field(description="The path to the video file to be recognised")
+    output_dir: Optional[str] = Field(default=None, description="Directory to write appearances.json and a best-face thumbnail per track to")
+    min_face_quality: float = Field(default=0.0, description="Ignore faces whose quality score (0-1) is below this when matching")
+    mode: Literal["track", "search", "live"] = Field(default="track", description="'track' to track every face frame by frame, 'search' to quickly find when the person appears, or 'live' to watch a live stream given as video_path (RTSP/HTTP URL or a file being written)")
+    sample_interval: float = Field(default=1.0, description="Seconds between sampled frames in 'search' mode")
+    recognition_interval: int = Field(default=0, description="In 'track' and 'live' mode, re-run recognition on a face already being followed only every N frames (0 recognises every face in every frame)")
+    max_duration: float = Field(default=60.0, gt=0, description="In 'live' mode, stop watching after this many seconds")
+    batch_size: int = Field(default=1, description="In 'track' mode, number of frames sent to the face models per inference call")
 
 class RecogniseTool(BaseTool):
     name: str = "RecogniseTool"
@@ -24,123 +611,267 @@ class RecogniseTool(BaseTool):
         "arbitrary_types_allowed": True
     }
     
-    # Declare these as class variables with None default
+    # Shared, read-only model; per-scan state lives on ScanSession
     app: FaceAnalysis = None
-    tracker: DeepSort = None
-    appearances: dict = {}
-    current_appearances: dict = {}
-
-    def __init__(self):
-        super().__init__()
-        # Initialize Face Analysis
-        self.app = FaceAnalysis(allowed_modules=['detection', 'recognition'], providers=['CPUExecutionProvider'])
-        self.app.prepare(ctx_id=0, det_size=(640, 640))
-        # Initialize DeepSORT Tracker
-        self.tracker = DeepSort(max_age=30, n_init=3)
-        # Dictionary to store appearance data for each track
-        self.appearances = {}
-        # Dictionary to store current appearance start times
-        self.current_appearances = {}
+    # Called with each appearance event as it happens in 'live' mode; prints them by default
+    on_event: Optional[Callable[[dict], None]] = None
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.app = get_face_analysis()
 
     def format_timedelta(self, td):
         """Convert timedelta to HH:MM:SS format"""
-        total_seconds = int(td.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        return format_timedelta(td)
 
-    def _run(self, image_path: str, video_path: str):
-        # Load and Process Input Image
+    def embed_image(self, image_path):
+        """Return the normalised embedding of the first face in an image, or None"""
         input_img = cv2.imread(image_path)
         input_faces = self.app.get(input_img)
         if not input_faces:
-            return "No face detected in input image."
-        
-        input_embedding = input_faces[0].embedding / np.linalg.norm(input_faces[0].embedding)
+            return None
+        return input_faces[0].embedding / np.linalg.norm(input_faces[0].embedding)
+
+    def scan(self, input_embedding, video_path, min_face_quality=0.0, recognition_interval=0, batch_size=1):
+        """
+        Track the target face through a video in a fresh ScanSession.
+
+        With batch_size > 1, frames are run through the detector and recogniser
+        batch_size at a time and the results fed to the tracker frame by frame.
+
+        Safe to call concurrently: the model is shared, the session is not.
+        """
+        session = ScanSession(input_embedding, min_face_quality=min_face_quality,
+                              recognition_interval=recognition_interval)
 
         # Process Video Frame-by-Frame
         cap = cv2.VideoCapture(video_path)
         fps = cap.get(cv2.CAP_PROP_FPS)
         frame_count = 0
+        batch = []
 
         while True:
             ret, frame = cap.read()
+            if ret:
+                current_time = frame_time(frame_count, fps)
+                frame_count += 1
+                batch.append((prepare_frame(frame), current_time))
+                if len(batch) < batch_size:
+                    continue
+            if not batch:
+                break
+
+            frames = [frame for frame, _ in batch]
+            if len(frames) == 1:
+                faces_per_frame = [session.get_faces(self.app, frames[0])]
+            else:
+                faces_per_frame = session.get_faces_batch(self.app, frames)
+            for (frame, current_time), faces in zip(batch, faces_per_frame):
+                session.update(faces, frame, current_time)
+            batch = []
+
             if not ret:
                 break
-            
-            frame_count += 1
-            current_time = timedelta(seconds=frame_count/fps)
-            
-            frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-
-            # Resize frame for better detection
-            scale_percent = 50
-            width = int(frame.shape[1] * scale_percent / 100)
-            height = int(frame.shape[0] * scale_percent / 100)
-            frame = cv2.resize(frame, (width, height))
-
-            faces = self.app.get(frame)
-            
-            detections = []
-            for face in faces:
-                emb = face.embedding / np.linalg.norm(face.embedding)
-                similarity = cosine_similarity([input_embedding], [emb])[0][0]
-                
-                if similarity > 0.5:
-                    bbox = face.bbox.astype(int)
-                    confidence = similarity
-                    detections.append(([bbox[0], bbox[1], bbox[2]-bbox[0], bbox[3]-bbox[1]], confidence, emb))
-
-            tracks = self.tracker.update_tracks(detections, frame=frame)
-
-            # Update appearances
-            active_tracks = set()
-            
-            for track in tracks:
-                if not track.is_confirmed():
+
+        cap.release()
+        # Appearances still open end with the last frame
+        session.finish(frame_time(frame_count, fps))
+        return session
+
+    def watch(self, input_embedding, source, on_event=None, max_latency=0.5, idle_timeout=10.0,
+              max_duration=None, stop_event=None, min_face_quality=0.0, recognition_interval=0):
+        """
+        Track the target face in a live source in real time.
+
+        Frames come from a LiveFrameReader, which drops frames rather than
+        queueing them when inference is slower than the source. Frames older than
+        max_latency seconds by the time they would be processed are dropped as
+        well. Times are measured on the wall clock from the start of the watch, so
+        they stay correct however many frames are dropped. on_event is called as
+        appearances start and end.
+
+        Runs until the source goes idle, max_duration elapses or stop_event is set.
+        Returns the ScanSession, with the number of dropped frames in `dropped_frames`.
+        Raises RuntimeError if reading the source fails.
+        """
+        session = ScanSession(input_embedding, min_face_quality=min_face_quality,
+                              recognition_interval=recognition_interval, on_event=on_event)
+        reader = LiveFrameReader(source, idle_timeout=idle_timeout).start()
+        started_at = time.monotonic()
+        late_frames = 0
+
+        try:
+            while stop_event is None or not stop_event.is_set():
+                if max_duration is not None and time.monotonic() - started_at > max_duration:
+                    break
+                latest = reader.read(timeout=max_latency)
+                if latest is None:
+                    if reader.finished:
+                        break
                     continue
-                    
-                track_id = track.track_id
-                active_tracks.add(track_id)
-                
-                # If this is a new appearance for this track
-                if track_id not in self.current_appearances:
-                    self.current_appearances[track_id] = current_time
-                    if track_id not in self.appearances:
-                        self.appearances[track_id] = []
-
-            # Check for tracks that have disappeared
-            for track_id in list(self.current_appearances.keys()):
-                if track_id not in active_tracks:
-                    start_time = self.current_appearances[track_id]
-                    duration = current_time - start_time
-                    self.appearances[track_id].append({
-                        'start_time': self.format_timedelta(start_time),
-                        'end_time': self.format_timedelta(current_time),
-                        'duration': self.format_timedelta(duration)
-                    })
-                    del self.current_appearances[track_id]
-
-        # Handle any remaining active appearances at the end of the video
-        for track_id, start_time in self.current_appearances.items():
-            duration = current_time - start_time
-            self.appearances[track_id].append({
-                'start_time': self.format_timedelta(start_time),
-                'end_time': self.format_timedelta(current_time),
-                'duration': self.format_timedelta(duration)
-            })
+                frame, captured_at = latest
+
+                # Shed load: never spend inference on a frame that is already stale
+                if time.monotonic() - captured_at > max_latency:
+                    late_frames += 1
+                    continue
+
+                current_time = timedelta(seconds=captured_at - started_at)
+                frame = prepare_frame(frame)
+                faces = session.get_faces(self.app, frame)
+                session.update(faces, frame, current_time)
+        finally:
+            reader.stop()
+
+        if reader.error is not None:
+            raise RuntimeError(f"Reading {source} failed: {reader.error}") from reader.error
+        session.finish()
+        session.dropped_frames = reader.dropped + late_frames
+        return session
+
+    def frame_matches(self, input_embedding, frame, similarity_threshold=0.5, min_face_quality=0.0):
+        """Return True if any face in the frame matches the target with at least min_face_quality"""
+        frame = prepare_frame(frame)
+        for face in self.app.get(frame):
+            emb = face.embedding / np.linalg.norm(face.embedding)
+            if cosine_similarity([input_embedding], [emb])[0][0] <= similarity_threshold:
+                continue
+            if min_face_quality > 0 and face_quality(face, crop_face(frame, face.bbox)) < min_face_quality:
+                continue
+            return True
+        return False
+
+    def search(self, input_embedding, video_path, sample_interval=1.0, similarity_threshold=0.5,
+               min_face_quality=0.0):
+        """
+        Find when the target appears with a coarse-to-fine search.
+
+        Frames are sampled every sample_interval seconds (frames in between are
+        only grabbed, never retrieved); the boundaries of each run of matching
+        samples are then bisected against the neighbouring non-matching samples
+        to the exact frame. Appearances shorter than sample_interval may be
+        missed. All intervals are reported under track ID 1, with frame-accurate
+        'start_seconds'/'end_seconds' alongside the HH:MM:SS times.
+        """
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        step = max(1, int(round(fps * sample_interval)))
+
+        # Coarse pass: sample every step-th frame
+        samples = []
+        frame_idx = 0
+        while True:
+            if frame_idx % step == 0:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                samples.append((frame_idx, self.frame_matches(input_embedding, frame, similarity_threshold,
+                                                              min_face_quality)))
+            elif not cap.grab():
+                break
+            frame_idx += 1
+        last_frame = frame_idx - 1
+
+        checked = dict(samples)
+        def matches_at(idx):
+            if idx not in checked:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+                ret, frame = cap.read()
+                checked[idx] = ret and self.frame_matches(input_embedding, frame, similarity_threshold,
+                                                          min_face_quality)
+            return checked[idx]
+
+        # Fine pass: bisect the boundaries of each run of matching samples
+        intervals = []
+        for i, (idx, hit) in enumerate(samples):
+            if not hit or (i > 0 and samples[i - 1][1]):
+                continue
+            start = idx
+            if i > 0:
+                lo, hi = samples[i - 1][0], idx
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if matches_at(mid):
+                        hi = mid
+                    else:
+                        lo = mid
+                start = hi
+
+            j = i
+            while j + 1 < len(samples) and samples[j + 1][1]:
+                j += 1
+            lo, hi = samples[j][0], samples[j + 1][0] if j + 1 < len(samples) else last_frame + 1
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if matches_at(mid):
+                    lo = mid
+                else:
+                    hi = mid
+            intervals.append((start, lo))
 
         cap.release()
 
+        appearances = []
+        for start, end in intervals:
+            start_time = frame_time(start, fps)
+            end_time = frame_time(end + 1, fps)
+            appearances.append({
+                'start_time': format_timedelta(start_time),
+                'end_time': format_timedelta(end_time),
+                'duration': format_timedelta(end_time - start_time),
+                'start_seconds': start_time.total_seconds(),
+                'end_seconds': end_time.total_seconds()
+            })
+        return {1: appearances} if appearances else {}
+
+    def scan_many(self, jobs, max_workers=None):
+        """
+        Run several scans in a thread pool over the shared model.
+
+        Parameters:
+        - jobs: iterable of (image_path, video_path[, output_dir]) tuples
+        - max_workers: size of the thread pool (defaults to ThreadPoolExecutor's)
+
+        All scans share one model, so tune SPOTLIGHT_ORT_THREADS (see
+        get_face_analysis) to about cores / max_workers for throughput to scale.
+
+        Returns the formatted result of each job, in order.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda job: self._run(*job), jobs))
+
+    def _run(self, image_path: str, video_path: str, output_dir: Optional[str] = None,
+             min_face_quality: float = 0.0, mode: str = "track", sample_interval: float = 1.0,
+             recognition_interval: int = 0, max_duration: float = 60.0, batch_size: int = 1):
+        # Load and Process Input Image
+        input_embedding = self.embed_image(image_path)
+        if input_embedding is None:
+            return "No face detected in input image."
+
+        if mode == "search":
+            if recognition_interval or batch_size != 1:
+                return "recognition_interval and batch_size are not supported in 'search' mode."
+            appearances = self.search(input_embedding, video_path, sample_interval=sample_interval,
+                                      min_face_quality=min_face_quality)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+                write_results({track_id: {'appearances': a} for track_id, a in appearances.items()}, output_dir)
+            return format_appearances(appearances)
+
+        if mode == "live":
+            if batch_size != 1:
+                return "batch_size is not supported in 'live' mode."
+            session = self.watch(input_embedding, video_path, on_event=self.on_event or print_event,
+                                 max_duration=max_duration, min_face_quality=min_face_quality,
+                                 recognition_interval=recognition_interval)
+            if output_dir:
+                session.save(output_dir)
+            return session.format_results() + f"\nDropped frames: {session.dropped_frames}\n"
+
+        session = self.scan(input_embedding, video_path, min_face_quality=min_face_quality,
+                            recognition_interval=recognition_interval, batch_size=batch_size)
+        if output_dir:
+            session.save(output_dir)
+
         # Format the results
-        result = "Appearance Times:\n"
-        for track_id, track_appearances in self.appearances.items():
-            result += f"\nTrack ID: {track_id}\n"
-            for idx, appearance in enumerate(track_appearances, 1):
-                result += f"Appearance {idx}:\n"
-                result += f"  Start Time: {appearance['start_time']}\n"
-                result += f"  End Time: {appearance['end_time']}\n"
-                result += f"  Duration: {appearance['duration']}\n"
-
-        return result
\ No newline at end of file
+        return session.format_results()
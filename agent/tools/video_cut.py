@@ -1,8 +1,17 @@
 import cv2
 import os
+import json
+import bisect
+import shutil
+import subprocess
+import tempfile
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from fractions import Fraction
 
-from typing import Type
+from typing import Literal, Type
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
@@ -12,64 +21,21 @@ class VideoCutToolInput(BaseModel):
     end_time: str = Field(description="The end time of the clip in HH:MM:SS format")
     track_id: int = Field(description="The ID of the tracked person")
     appearance_num: int = Field(description="The appearance number for this track")
+    codec: Literal["h264", "h265", "mp4v"] = Field(default="mp4v", description="Output codec: 'h264' or 'h265' (needs ffmpeg), or 'mp4v'")
 
 class VideoCutTool(BaseTool):
     name: str = "VideoCutTool"
     description: str = "A tool to cut a video based on start and end times"
     args_schema: Type[BaseModel] = VideoCutToolInput
 
-    def _run(self, input_video_path: str,  start_time: str, end_time: str, track_id: int, appearance_num: int):
+    def _run(self, input_video_path: str,  start_time: str, end_time: str, track_id: int, appearance_num: int,
+             codec: Literal["h264", "h265", "mp4v"] = "mp4v"):
         """
         Extract a clip from the video based on start and end times
         """
-        # Create output directory if it doesn't exist
         output_path = os.path.join(os.getcwd(), "data", "output_clips")
-        os.makedirs(output_path, exist_ok=True)
-        
-        # Open the video file
-        cap = cv2.VideoCapture(input_video_path)
-        
-        # Get video properties
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        # Convert times to frame numbers
-        start_frame = int(self.time_to_seconds(start_time) * fps)
-        end_frame = int(self.time_to_seconds(end_time) * fps)
-        
-        # Create output filename
-        output_filename = f"person_{track_id}_appearance_{appearance_num}.mp4"
-        output_file = os.path.join(output_path, output_filename)
-        
-        # Initialize video writer
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
-        
-        # Set frame position to start frame
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-        
-        # Read and write frames
-        current_frame = start_frame
-        while current_frame <= end_frame:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            # Write the frame
-            out.write(frame)
-            current_frame += 1
-            
-            # Optional: Show progress
-            if current_frame % 30 == 0:  # Update every 30 frames
-                progress = (current_frame - start_frame) / (end_frame - start_frame) * 100
-                print(f"\rProcessing clip {output_filename}: {progress:.1f}%", end="")
-        
-        # Release resources
-        cap.release()
-        out.release()
-        print(f"\nSaved clip: {output_filename}")
-        return output_file
+        return create_clip(input_video_path, output_path, start_time, end_time, track_id, appearance_num,
+                           codec=codec)
 
     @staticmethod
     def time_to_seconds(time_str):
@@ -77,21 +43,43 @@ class VideoCutTool(BaseTool):
         h, m, s = map(int, time_str.split(':'))
         return h * 3600 + m * 60 + s
 
-def create_clip(input_video_path, output_path, start_time, end_time, track_id, appearance_num):
-    """
-    Extract a clip from the video based on start and end times
-    
-    Parameters:
-    - input_video_path: path to the source video
-    - output_path: directory where clips will be saved
-    - start_time: clip start time in HH:MM:SS format
-    - end_time: clip end time in HH:MM:SS format
-    - track_id: ID of the tracked person
-    - appearance_num: appearance number for this track
-    """
-    # Create output directory if it doesn't exist
-    os.makedirs(output_path, exist_ok=True)
-    
+# ffmpeg encoders for the codecs create_clip accepts besides OpenCV's mp4v
+FFMPEG_CODECS = {
+    "h264": "libx264",
+    "h265": "libx265",
+}
+
+def _check_codec(codec):
+    if codec != "mp4v" and codec not in FFMPEG_CODECS:
+        raise ValueError(f"Unknown codec {codec!r}: expected 'h264', 'h265' or 'mp4v'")
+
+def _temp_path(output_file):
+    """Reserve a hidden temp file next to output_file with the same extension"""
+    directory, filename = os.path.split(os.path.abspath(output_file))
+    while True:
+        temp_file = os.path.join(directory, f".{filename}.{uuid.uuid4().hex[:8]}{os.path.splitext(filename)[1]}")
+        try:
+            # Created like any new file, so the umask applies (mkstemp would make it 0600,
+            # and os.replace keeps the mode)
+            os.close(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            return temp_file
+        except FileExistsError:
+            continue
+
+def _encode_ffmpeg(input_video_path, output_file, start_seconds, end_seconds, codec, preset, crf, threads):
+    """Re-encode [start, end] of the source with ffmpeg, raising RuntimeError with the reason on failure"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg not found")
+    _run_tool(
+        [ffmpeg, "-y", "-loglevel", "error",
+         "-ss", str(start_seconds), "-i", input_video_path, "-t", str(end_seconds - start_seconds),
+         "-c:v", FFMPEG_CODECS[codec], "-preset", preset, "-crf", str(crf),
+         "-threads", str(threads), "-c:a", "aac", "-movflags", "+faststart", output_file]
+    )
+
+def _encode_opencv(input_video_path, output_file, start_seconds, end_seconds, output_filename):
+    """Re-encode [start, end] of the source as mp4v with OpenCV"""
     # Open the video file
     cap = cv2.VideoCapture(input_video_path)
     
@@ -101,12 +89,8 @@ def create_clip(input_video_path, output_path, start_time, end_time, track_id, a
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     
     # Convert times to frame numbers
-    start_frame = int(VideoCutTool.time_to_seconds(start_time) * fps)
-    end_frame = int(VideoCutTool.time_to_seconds(end_time) * fps)
-    
-    # Create output filename
-    output_filename = f"person_{track_id}_appearance_{appearance_num}.mp4"
-    output_file = os.path.join(output_path, output_filename)
+    start_frame = int(start_seconds * fps)
+    end_frame = int(end_seconds * fps)
     
     # Initialize video writer
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -128,15 +112,353 @@ def create_clip(input_video_path, output_path, start_time, end_time, track_id, a
         
         # Optional: Show progress
         if current_frame % 30 == 0:  # Update every 30 frames
-            progress = (current_frame - start_frame) / (end_frame - start_frame) * 100
+            progress = (current_frame - start_frame) / max(1, end_frame - start_frame) * 100
             print(f"\rProcessing clip {output_filename}: {progress:.1f}%", end="")
     
     # Release resources
     cap.release()
     out.release()
+
+def create_clip(input_video_path, output_path, start_time, end_time, track_id, appearance_num,
+                codec="mp4v", preset="veryfast", crf=23, threads=0):
+    """
+    Extract a clip from the video based on start and end times
+    
+    Parameters:
+    - input_video_path: path to the source video
+    - output_path: directory where clips will be saved
+    - start_time: clip start time in HH:MM:SS format
+    - end_time: clip end time in HH:MM:SS format
+    - track_id: ID of the tracked person
+    - appearance_num: appearance number for this track
+    - codec: "h264" or "h265" to encode with ffmpeg, or "mp4v" to encode with OpenCV
+      (also used, with a printed warning, when ffmpeg is missing or fails)
+    - preset: ffmpeg speed/quality preset, e.g. "ultrafast", "veryfast", "medium"
+    - crf: ffmpeg constant rate factor (lower is better quality)
+    - threads: encoder threads per clip for ffmpeg (0 lets ffmpeg decide)
+
+    The clip is written to a temp file and renamed into place, so a finished
+    output file is never partially written. Raises ValueError for an unknown codec.
+    """
+    _check_codec(codec)
+    # Create output directory if it doesn't exist
+    os.makedirs(output_path, exist_ok=True)
+    
+    # Create output filename
+    output_filename = f"person_{track_id}_appearance_{appearance_num}.mp4"
+    output_file = os.path.join(output_path, output_filename)
+
+    start_seconds = VideoCutTool.time_to_seconds(start_time)
+    end_seconds = VideoCutTool.time_to_seconds(end_time)
+
+    temp_file = _temp_path(output_file)
+    try:
+        encoded = False
+        if codec in FFMPEG_CODECS:
+            try:
+                _encode_ffmpeg(input_video_path, temp_file, start_seconds, end_seconds, codec, preset, crf, threads)
+                encoded = True
+            except RuntimeError as e:
+                print(f"\nCould not encode {output_filename} as {codec} ({e}); falling back to mp4v")
+        if not encoded:
+            _encode_opencv(input_video_path, temp_file, start_seconds, end_seconds, output_filename)
+        os.replace(temp_file, output_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
     print(f"\nSaved clip: {output_filename}")
+    return output_file
+
+def merge_intervals(appearances):
+    """
+    Flatten appearances of every track into sorted, non-overlapping (start, end) seconds
+
+    Frame-accurate 'start_seconds'/'end_seconds' are used when an appearance has them.
+    """
+    intervals = sorted(
+        (appearance.get('start_seconds', VideoCutTool.time_to_seconds(appearance['start_time'])),
+         appearance.get('end_seconds', VideoCutTool.time_to_seconds(appearance['end_time'])))
+        for track_appearances in appearances.values()
+        for appearance in track_appearances
+    )
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _run_tool(args):
+    """Run an ffmpeg/ffprobe command and return its stdout, raising with its stderr on failure"""
+    result = subprocess.run(args, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(args[0])} failed: {result.stderr.strip()}")
+    return result.stdout
+
+def _ffmpeg_tools():
+    """Return the (ffmpeg, ffprobe) executables, or None unless both are installed"""
+    ffmpeg, ffprobe = shutil.which("ffmpeg"), shutil.which("ffprobe")
+    if ffmpeg is None or ffprobe is None:
+        return None
+    return ffmpeg, ffprobe
 
-def process_appearances(appearances, input_video_path, output_path):
+def _probe_source(ffprobe, input_video_path):
+    """
+    Return the source's video stream, audio stream (or None) and video packets.
+
+    Packets are (pts, dts, is_keyframe) in seconds, sorted by presentation time.
+    """
+    streams = json.loads(_run_tool(
+        [ffprobe, "-v", "error", "-show_streams", "-of", "json", input_video_path]
+    )).get("streams", [])
+    video = next(stream for stream in streams if stream["codec_type"] == "video")
+    audio = next((stream for stream in streams if stream["codec_type"] == "audio"), None)
+    # Reading packets only demuxes, so this is quick even for long sources
+    output = _run_tool(
+        [ffprobe, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,dts_time,flags", "-of", "csv=p=0", input_video_path]
+    )
+    packets = []
+    for line in output.splitlines():
+        fields = line.strip().split(",")
+        if len(fields) < 3 or "N/A" in fields[:2]:
+            continue
+        packets.append((float(fields[0]), float(fields[1]), "K" in fields[2]))
+    return video, audio, sorted(packets)
+
+def _copy_points(packets, intervals, frame_duration):
+    """
+    Return concat (inpoint, outpoint, duration) entries that stream-copy exactly the
+    frames shown in each interval, or None if any interval can't be copied exactly.
+
+    An interval must start on a keyframe. The concat demuxer ends an interval at the
+    first packet whose decoding time reaches the out-point, so with B-frames the
+    out-point is the earliest DTS of the frames shown from `end` on, and the cut
+    is only exact if every frame shown before `end` is decoded before that.
+    The duration is set explicitly so timestamps stay monotonic across joins.
+    """
+    if not packets:
+        return None
+    tolerance = frame_duration / 2
+    pts = [packet[0] for packet in packets]
+    dts = [packet[1] for packet in packets]
+    # Earliest DTS among the frames shown from each packet on
+    later_dts = [float("inf")] * (len(packets) + 1)
+    for i in reversed(range(len(packets))):
+        later_dts[i] = min(dts[i], later_dts[i + 1])
+    video_end = pts[-1] + frame_duration
+
+    entries = []
+    for start, end in intervals:
+        first = bisect.bisect_left(pts, start - tolerance)
+        stop = bisect.bisect_left(pts, end - tolerance)
+        if first >= stop or not packets[first][2] or abs(pts[first] - start) > tolerance:
+            return None
+        if max(dts[first:stop]) >= later_dts[stop]:
+            return None
+        if stop == len(pts):
+            entries.append((pts[first], None, video_end - pts[first]))
+        else:
+            entries.append((pts[first], later_dts[stop], pts[stop] - pts[first]))
+    return entries
+
+def _video_encoder_args(codec, preset, crf):
+    """ffmpeg video encoder arguments for one of the codecs create_clip accepts"""
+    if codec == "mp4v":
+        return ["-c:v", "mpeg4", "-q:v", "3"]
+    return ["-c:v", FFMPEG_CODECS[codec], "-preset", preset, "-crf", str(crf)]
+
+def _concat_copy(ffmpeg, input_video_path, entries, output_file):
+    """Join (inpoint, outpoint, duration) parts of the source with ffmpeg's concat demuxer without re-encoding"""
+    escaped = os.path.abspath(input_video_path).replace("'", "'\\''")
+    lines = ["ffconcat version 1.0"]
+    for inpoint, outpoint, duration in entries:
+        lines += [f"file '{escaped}'", f"inpoint {inpoint}", f"duration {duration}"]
+        if outpoint is not None:
+            lines.append(f"outpoint {outpoint}")
+
+    # The concat list is a few lines of text, not a clip
+    with tempfile.NamedTemporaryFile("w", suffix=".ffconcat", delete=False) as f:
+        f.write("\n".join(lines) + "\n")
+        list_path = f.name
+    try:
+        _run_tool([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                   "-i", list_path, "-c", "copy", "-avoid_negative_ts", "make_zero",
+                   "-movflags", "+faststart", output_file])
+    finally:
+        os.remove(list_path)
+
+def _filter_highlights(ffmpeg, input_video_path, intervals, output_file, crossfade, has_audio,
+                       frame_rate, codec, preset, crf):
+    """Re-encode the intervals in one ffmpeg pass, with audio and optional crossfades"""
+    graph = []
+    for i, (start, end) in enumerate(intervals):
+        # xfade needs an explicit constant frame rate on its inputs
+        graph.append(f"[0:v]trim=start={start}:end={end},setpts=PTS-STARTPTS,fps={frame_rate}[v{i}]")
+        if has_audio:
+            graph.append(f"[0:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[a{i}]")
+
+    if crossfade <= 0:
+        inputs = "".join(f"[v{i}]" + (f"[a{i}]" if has_audio else "") for i in range(len(intervals)))
+        graph.append(f"{inputs}concat=n={len(intervals)}:v=1:a={int(has_audio)}[v]" + ("[a]" if has_audio else ""))
+        video_label, audio_label = "v", "a"
+    else:
+        video_label, audio_label = "v0", "a0"
+        length = intervals[0][1] - intervals[0][0]
+        for i, (start, end) in enumerate(intervals[1:], 1):
+            fade = min(crossfade, length / 2, (end - start) / 2)
+            graph.append(f"[{video_label}][v{i}]xfade=transition=fade:duration={fade}:offset={length - fade}[vx{i}]")
+            if has_audio:
+                graph.append(f"[{audio_label}][a{i}]acrossfade=d={fade}[ax{i}]")
+            video_label, audio_label = f"vx{i}", f"ax{i}"
+            length += end - start - fade
+
+    args = [ffmpeg, "-y", "-loglevel", "error", "-i", input_video_path,
+            "-filter_complex", ";".join(graph), "-map", f"[{video_label}]"]
+    if has_audio:
+        args += ["-map", f"[{audio_label}]", "-c:a", "aac"]
+    # xfade outputs 4:4:4, which browsers and hardware decoders can't play
+    args += _video_encoder_args(codec, preset, crf) + ["-pix_fmt", "yuv420p",
+                                                      "-movflags", "+faststart", output_file]
+    _run_tool(args)
+
+def _ffmpeg_highlights(tools, input_video_path, intervals, output_file, crossfade, stream_copy,
+                       codec, preset, crf):
+    """
+    Compile the reel with ffmpeg in a single pass over the source.
+
+    With hard cuts, if every interval can be cut exactly on the source's packets
+    (see _copy_points), the reel is one stream copy. Otherwise it is one
+    re-encoding pass in the requested codec.
+    """
+    ffmpeg, ffprobe = tools
+    video, audio, packets = _probe_source(ffprobe, input_video_path)
+    frame_rate = video.get("avg_frame_rate", "0/1")
+    if Fraction(frame_rate) == 0:
+        frame_rate = "25/1"
+    frame_duration = 1 / float(Fraction(frame_rate))
+    # Keep at least one frame per interval
+    intervals = [(start, max(end, start + frame_duration)) for start, end in intervals]
+
+    entries = None
+    if stream_copy and crossfade <= 0:
+        entries = _copy_points(packets, intervals, frame_duration)
+    if entries is not None:
+        _concat_copy(ffmpeg, input_video_path, entries, output_file)
+        print(f"Stream-copied {len(intervals)} intervals")
+    else:
+        _filter_highlights(ffmpeg, input_video_path, intervals, output_file, crossfade,
+                           audio is not None, frame_rate, codec, preset, crf)
+        print(f"Re-encoded {len(intervals)} intervals")
+
+def compile_highlights(appearances, input_video_path, output_file, crossfade=0.0, stream_copy=True,
+                       codec="h264", preset="veryfast", crf=23):
+    """
+    Compile every appearance into one highlight video in a single pass over the source
+    
+    Parameters:
+    - appearances: dictionary of appearances by track_id
+    - input_video_path: path to the source video
+    - output_file: path of the highlight video to write
+    - crossfade: length in seconds of the crossfade at each join (0 for hard cuts)
+    - stream_copy: with hard cuts, copy the streams when every interval starts on a keyframe
+      and ends on a clean cut, instead of re-encoding
+    - codec, preset, crf: encoding of re-encoded output (see create_clip)
+
+    The whole reel is either stream-copied, when every interval can be cut exactly
+    (see _copy_points), or re-encoded in one filter graph; no intermediate clip
+    files are written. Needs ffmpeg and ffprobe to keep the audio. Without them
+    the reel is written by OpenCV as mp4v, without audio.
+    """
+    _check_codec(codec)
+    intervals = merge_intervals(appearances)
+    if not intervals:
+        print("No appearances to compile")
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+
+    # Write to a temp file and rename it into place once complete
+    temp_file = _temp_path(output_file)
+    try:
+        tools = _ffmpeg_tools()
+        if tools is not None:
+            _ffmpeg_highlights(tools, input_video_path, intervals, temp_file, crossfade, stream_copy,
+                               codec, preset, crf)
+        else:
+            print("ffmpeg/ffprobe not found: compiling highlights with OpenCV as mp4v, without audio")
+            _reencode_highlights(input_video_path, intervals, temp_file, crossfade)
+        os.replace(temp_file, output_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    print(f"\nSaved highlights: {output_file}")
+    return output_file
+
+def _reencode_highlights(input_video_path, intervals, output_file, crossfade):
+    """Write the intervals in one OpenCV pass over the source, crossfading the joins"""
+    # Open the video file once for every interval
+    cap = cv2.VideoCapture(input_video_path)
+    
+    # Get video properties
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fade_frames = int(crossfade * fps)
+    
+    # Initialize video writer
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
+
+    # Last frames of the previous interval, held back to blend into the next one
+    tail = deque()
+    position = 0
+    for idx, (start, end) in enumerate(intervals, 1):
+        start_frame = int(start * fps)
+        end_frame = int(end * fps)
+
+        # Seek only for large jumps; short gaps are cheaper to skip with grab()
+        if start_frame < position or start_frame - position > fps * 2:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            position = start_frame
+        while position < start_frame and cap.grab():
+            position += 1
+
+        fade = min(fade_frames, len(tail), (end_frame - start_frame + 1) // 2)
+        # Flush the part of the previous tail that is not blended
+        while len(tail) > fade:
+            out.write(tail.popleft())
+        previous, tail = tail, deque()
+
+        while position <= end_frame:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            position += 1
+
+            if previous:
+                alpha = (fade - len(previous) + 1) / (fade + 1)
+                frame = cv2.addWeighted(previous.popleft(), 1 - alpha, frame, alpha, 0)
+                out.write(frame)
+                continue
+
+            tail.append(frame)
+            if len(tail) > fade_frames:
+                out.write(tail.popleft())
+
+        print(f"\rCompiling highlights: interval {idx}/{len(intervals)}", end="")
+
+    while tail:
+        out.write(tail.popleft())
+
+    # Release resources
+    cap.release()
+    out.release()
+
+def process_appearances(appearances, input_video_path, output_path, mode="clips", crossfade=0.0,
+                        codec="mp4v", preset="veryfast", max_workers=None):
     """
     Process all appearances and create respective video clips
     
@@ -144,23 +466,49 @@ def process_appearances(appearances, input_video_path, output_path):
     - appearances: dictionary of appearances by track_id
     - input_video_path: path to the source video
     - output_path: directory where clips will be saved
+    - mode: "clips" for one clip per appearance, "reel" for a single highlights.mp4
+    - crossfade: crossfade length in seconds between appearances in "reel" mode
+    - codec, preset: output codec and ffmpeg preset for each clip or the reel (see create_clip)
+    - max_workers: maximum number of clips encoded at once (defaults to min(4, CPU count))
     """
-    for track_id, track_appearances in appearances.items():
-        for idx, appearance in enumerate(track_appearances, 1):
-            start_time = appearance['start_time']
-            end_time = appearance['end_time']
-            
-            print(f"\nProcessing Track ID {track_id}, Appearance {idx}")
-            print(f"Time range: {start_time} to {end_time}")
-            
-            create_clip(
-                input_video_path=input_video_path,
-                output_path=output_path,
-                start_time=start_time,
-                end_time=end_time,
-                track_id=track_id,
-                appearance_num=idx
-            )
+    if mode == "reel":
+        return compile_highlights(
+            appearances,
+            input_video_path,
+            os.path.join(output_path, "highlights.mp4"),
+            crossfade=crossfade,
+            codec=codec,
+            preset=preset
+        )
+
+    cpu_count = os.cpu_count() or 1
+    max_workers = max_workers or min(4, cpu_count)
+    # Share the cores between the concurrent ffmpeg encoders
+    threads = max(1, cpu_count // max_workers)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for track_id, track_appearances in appearances.items():
+            for idx, appearance in enumerate(track_appearances, 1):
+                start_time = appearance['start_time']
+                end_time = appearance['end_time']
+                
+                print(f"\nProcessing Track ID {track_id}, Appearance {idx}")
+                print(f"Time range: {start_time} to {end_time}")
+                
+                futures.append(executor.submit(
+                    create_clip,
+                    input_video_path=input_video_path,
+                    output_path=output_path,
+                    start_time=start_time,
+                    end_time=end_time,
+                    track_id=track_id,
+                    appearance_num=idx,
+                    codec=codec,
+                    preset=preset,
+                    threads=threads
+                ))
+    return [future.result() for future in futures]
 
 # # Example usage
 # if __name__ == "__main__":
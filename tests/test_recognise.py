@@ -0,0 +1,434 @@
+import json
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import onnx
+import pytest
+from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.model_zoo.scrfd import SCRFD
+from onnx import TensorProto, helper, numpy_helper
+
+from agent.tools import recognise
+
+FPS = 25
+TARGET = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+OTHER = np.array([0.0, 1.0, 0.0, 0.0], dtype=np.float32)
+
+
+def encode_frame(idx):
+    """Flat frame carrying its index in the first two channels, so it survives rotation and resizing"""
+    frame = np.zeros((40, 40, 3), dtype=np.uint8)
+    frame[..., 0] = idx % 256
+    frame[..., 1] = idx // 256
+    return frame
+
+
+def decode_frame(frame):
+    return int(frame[0, 0, 0]) + 256 * int(frame[0, 0, 1])
+
+
+class FakeCapture:
+    """Video of frame_total frames, numbered from first_index"""
+
+    def __init__(self, frame_total, first_index=0):
+        self.frame_total = frame_total
+        self.first_index = first_index
+        self.pos = 0
+        self.decoded = 0
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        if prop == recognise.cv2.CAP_PROP_FPS:
+            return FPS
+        if prop == recognise.cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_total
+        return 0
+
+    def set(self, prop, value):
+        assert prop == recognise.cv2.CAP_PROP_POS_FRAMES
+        self.pos = int(value)
+        return True
+
+    def grab(self):
+        if self.pos >= self.frame_total:
+            return False
+        self.pos += 1
+        return True
+
+    def read(self):
+        if self.pos >= self.frame_total:
+            return False, None
+        self.decoded += 1
+        frame = encode_frame(self.first_index + self.pos)
+        self.pos += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+class FakeApp(FaceAnalysis):
+    """Finds one face per frame, matching the target on the given frame indices"""
+
+    def __init__(self, present):
+        self.present = present
+        self.calls = []
+
+    def get(self, img, max_num=0):
+        idx = decode_frame(img)
+        self.calls.append(idx)
+        embedding = TARGET if idx in self.present else OTHER
+        return [Face(bbox=np.array([2.0, 2.0, 18.0, 18.0]), det_score=0.9, embedding=embedding)]
+
+
+def make_tool(monkeypatch, present, frame_total, first_index=None):
+    """Tool over a FakeApp; first_index maps video paths to where their frame numbering starts"""
+    app = FakeApp(present)
+    captures = []
+
+    def open_capture(path):
+        captures.append(FakeCapture(frame_total, (first_index or {}).get(path, 0)))
+        return captures[-1]
+
+    monkeypatch.setattr(recognise, "get_face_analysis", lambda: app)
+    monkeypatch.setattr(recognise.cv2, "VideoCapture", open_capture)
+    return recognise.RecogniseTool(), app, captures
+
+
+def test_search_bisects_to_exact_frames(monkeypatch):
+    frame_total = 3000
+    present = set(range(1234, 1877)) | set(range(2500, frame_total))
+    tool, app, captures = make_tool(monkeypatch, present, frame_total)
+
+    appearances = tool.search(TARGET, "video.mp4", sample_interval=1.0)
+
+    intervals = [(a['start_seconds'], a['end_seconds']) for a in appearances[1]]
+    assert intervals == [
+        pytest.approx((1234 / FPS, 1877 / FPS)),
+        pytest.approx((2500 / FPS, frame_total / FPS)),
+    ]
+    assert appearances[1][0]['start_time'] == "00:00:49"
+    # One sample a second plus a handful of bisection probes per boundary
+    assert len(app.calls) < frame_total // FPS + 40
+    assert captures[0].decoded == len(app.calls)
+
+
+def test_search_without_matches(monkeypatch):
+    tool, app, _ = make_tool(monkeypatch, set(), 500)
+
+    assert tool.search(TARGET, "video.mp4", sample_interval=2.0) == {}
+    assert app.calls == list(range(0, 500, 2 * FPS))
+
+
+def test_search_honours_min_face_quality(monkeypatch):
+    # Flat frames have no sharpness, so every face falls below the quality floor
+    tool, _, _ = make_tool(monkeypatch, set(range(100, 300)), 500)
+
+    assert tool.search(TARGET, "video.mp4", min_face_quality=0.1) == {}
+    assert len(tool.search(TARGET, "video.mp4")[1]) == 1
+
+
+def test_scan_reports_zero_based_frame_times(monkeypatch):
+    # Present from frame 97 to the end; DeepSORT confirms the track on its third hit
+    tool, _, _ = make_tool(monkeypatch, set(range(97, 300)), 300)
+
+    appearances = tool.scan(TARGET, "video.mp4").appearances
+
+    # Frame 99 is shown at 3.96 s (1-based counting would give 4.00 s); the
+    # appearance still open at the end closes when the last frame ends, at 12 s
+    assert appearances == {'1': [{'start_time': '00:00:03', 'end_time': '00:00:12', 'duration': '00:00:08'}]}
+
+
+def test_run_starts_each_call_with_fresh_tracks(monkeypatch):
+    # The person is only in the first video
+    tool, _, _ = make_tool(monkeypatch, set(range(10, 60)), 100, first_index={"b.mp4": 1000})
+    monkeypatch.setattr(recognise.RecogniseTool, "embed_image", lambda self, path: TARGET)
+
+    first = tool._run("face.jpg", "a.mp4")
+    second = tool._run("face.jpg", "b.mp4")
+
+    assert "Track ID: 1" in first
+    assert second == "Appearance Times:\n"
+
+
+def test_scan_many_matches_solo_runs(monkeypatch):
+    present = set(range(10, 60)) | set(range(1030, 1090))
+    tool, _, _ = make_tool(monkeypatch, present, 100, first_index={"b.mp4": 1000})
+    monkeypatch.setattr(recognise.RecogniseTool, "embed_image", lambda self, path: TARGET)
+    jobs = [("face.jpg", "a.mp4"), ("face.jpg", "b.mp4")]
+
+    results = tool.scan_many(jobs, max_workers=2)
+
+    assert results == [tool._run(*job) for job in jobs]
+    # Each scan numbers its own tracks from 1
+    assert all("Track ID: 1\n" in result for result in results)
+    assert results[0] != results[1]
+
+
+def test_frame_time_is_zero_based():
+    assert recognise.frame_time(0, FPS).total_seconds() == 0
+    assert recognise.frame_time(50, FPS).total_seconds() == 2
+
+
+def textured_frame(size=200):
+    return np.random.default_rng(0).integers(0, 256, (size, size, 3), dtype=np.uint8)
+
+
+def test_face_quality_prefers_sharper_and_larger_faces():
+    frame = textured_frame()
+    blurred = cv2.GaussianBlur(frame, (15, 15), 5)
+    small = Face(bbox=np.array([50.0, 50.0, 90.0, 90.0]), det_score=0.9)
+    large = Face(bbox=np.array([50.0, 50.0, 150.0, 150.0]), det_score=0.9)
+
+    sharp_quality = recognise.face_quality(small, recognise.crop_face(frame, small.bbox))
+    blurred_quality = recognise.face_quality(small, recognise.crop_face(blurred, small.bbox))
+    large_quality = recognise.face_quality(large, recognise.crop_face(frame, large.bbox))
+
+    assert 0 <= blurred_quality < sharp_quality < large_quality <= 1
+    assert recognise.face_quality(small, frame[:0, :0]) == 0.0
+
+
+def scan_faces(session, det_scores, embeddings=None):
+    """Feed the session one face per frame at a fixed box, with the given scores and embeddings"""
+    frame = textured_frame()
+    for i, det_score in enumerate(det_scores):
+        embedding = TARGET if embeddings is None else embeddings[i]
+        face = Face(bbox=np.array([50.0, 50.0, 130.0, 130.0]), det_score=det_score, embedding=embedding)
+        session.update([face], frame, recognise.frame_time(i, FPS))
+    session.finish()
+
+
+def test_best_face_keeps_highest_quality_matched_crop():
+    session = recognise.ScanSession(TARGET)
+    # The unmatched face on the last frame would score highest, but is not the target
+    scan_faces(session, [0.5, 0.5, 0.5, 0.9, 0.6, 1.0],
+               embeddings=[TARGET] * 5 + [OTHER])
+
+    (track_id,) = session.best_faces
+    quality, crop = session.best_faces[track_id]
+    frame = textured_frame()
+    face = Face(bbox=np.array([50.0, 50.0, 130.0, 130.0]), det_score=0.9)
+    assert quality == pytest.approx(recognise.face_quality(face, recognise.crop_face(frame, face.bbox)))
+    assert crop.shape == (112, 112, 3)
+
+
+def test_save_writes_small_thumbnails_and_quality(tmp_path):
+    session = recognise.ScanSession(TARGET)
+    scan_faces(session, [0.9] * 5)
+
+    results_path = session.save(str(tmp_path), thumbnail_size=64)
+
+    with open(results_path) as f:
+        results = json.load(f)
+    (track_id, entry), = results.items()
+    assert entry['thumbnail'] == str(tmp_path / f"track_{track_id}.jpg")
+    assert entry['face_quality'] == pytest.approx(session.best_faces[track_id][0], abs=1e-4)
+    assert len(entry['appearances']) == 1
+    thumbnail = cv2.imread(entry['thumbnail'])
+    assert max(thumbnail.shape[:2]) <= 64
+    assert f"Thumbnail: {entry['thumbnail']}" in session.format_results()
+
+
+# ArcFace's five reference landmarks in a 112px crop
+LANDMARKS = np.array([[38.29, 51.69], [73.53, 51.50], [56.02, 71.74], [41.55, 92.37], [70.73, 92.20]],
+                     dtype=np.float32)
+
+
+class FakeRecognition:
+    """Embeds faces on the bright left of the frame as the target and counts embeddings"""
+
+    input_size = (112, 112)
+
+    def __init__(self):
+        self.calls = 0
+        self.embedded = 0
+
+    def get_feat(self, imgs):
+        self.calls += 1
+        self.embedded += len(imgs)
+        return np.array([TARGET if img.mean() > 127 else OTHER for img in imgs])
+
+
+def make_face(bbox):
+    bbox = np.array(bbox, dtype=np.float32)
+    kps = bbox[:2] + LANDMARKS / 112 * (bbox[2:] - bbox[:2])
+    return Face(bbox=bbox, kps=kps, det_score=0.9)
+
+
+def cache_frame():
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    frame[:, :100] = 255
+    return frame
+
+
+def run_cache(boxes, interval=3):
+    recognition = FakeRecognition()
+    app = SimpleNamespace(models={'recognition': recognition})
+    cache = recognise.RecognitionCache(TARGET, interval=interval)
+    frame = cache_frame()
+    for bbox in boxes:
+        faces = [make_face(bbox)]
+        cache.get(app, frame, faces)
+        assert faces[0].embedding is not None
+    return recognition.embedded
+
+
+def test_cache_reembeds_target_every_interval():
+    boxes = [(10 + i, 10, 50 + i, 50) for i in range(10)]
+    # Frames 1, 4, 7 and 10
+    assert run_cache(boxes, interval=3) == 4
+
+
+def test_cache_never_reembeds_followed_non_target():
+    boxes = [(200 + i, 10, 240 + i, 50) for i in range(10)]
+    assert run_cache(boxes, interval=3) == 1
+
+
+def test_cache_follows_fast_motion_with_velocity():
+    # After speeding up to 18px steps on a 40px box, IoU with the last box is 0.38
+    # but IoU with the constant-velocity prediction stays above the threshold
+    xs = [200, 210, 220, 230, 248, 266, 284, 302]
+    boxes = [(x, 10, x + 40, 50) for x in xs]
+    assert run_cache(boxes) == 1
+    assert run_cache([boxes[0], boxes[3], boxes[4]]) == 3
+
+
+def test_cache_reembeds_on_box_jump_or_scale_change():
+    jump = [(200, 10, 240, 50)] * 3 + [(400, 10, 440, 50)] * 3
+    assert run_cache(jump) == 2
+    grow = [(200, 10, 240, 50)] * 3 + [(190, 0, 250, 60)] * 3
+    assert run_cache(grow) == 2
+
+
+def cache_batch(start, count):
+    return [[make_face((10 + i, 10, 50 + i, 50)), make_face((200 + i, 10, 240 + i, 50))]
+            for i in range(start, start + count)]
+
+
+def test_cache_embeds_a_batch_in_one_call():
+    recognition = FakeRecognition()
+    app = SimpleNamespace(models={'recognition': recognition})
+    cache = recognise.RecognitionCache(TARGET, interval=10)
+
+    faces_per_frame = cache_batch(0, 8)
+    cache.get_batch(app, [cache_frame()] * 8, faces_per_frame)
+
+    assert (recognition.calls, recognition.embedded) == (1, 2)
+    for target, other in faces_per_frame:
+        assert np.array_equal(target.embedding, TARGET)
+        assert np.array_equal(other.embedding, OTHER)
+
+    # Frame 11 re-embeds the target, known from the previous batch, but not the other face
+    cache.get_batch(app, [cache_frame()] * 3, cache_batch(8, 3))
+    assert (recognition.calls, recognition.embedded) == (2, 3)
+
+
+def test_cache_batch_matches_frame_by_frame():
+    # With batches longer than the interval, verdicts from earlier in the batch are
+    # settled before they are needed, so the same faces get embedded as with get()
+    recognition = FakeRecognition()
+    app = SimpleNamespace(models={'recognition': recognition})
+    cache = recognise.RecognitionCache(TARGET, interval=3)
+
+    cache.get_batch(app, [cache_frame()] * 8, cache_batch(0, 8))
+
+    # Both faces on frame 1, then only the target on frames 4 and 7
+    assert recognition.embedded == 4
+
+
+def write_detector(path, batch, batched, size=64):
+    """
+    Write a tiny SCRFD-shaped detector: 3 strides x 2 anchors with scores, boxes and keypoints.
+
+    Each output is a 1x1 convolution of the input pooled to the stride, so the
+    detections depend on the image. With batched=False the batch is flattened
+    into the first output axis, as in the stock exports.
+    """
+    rng = np.random.default_rng(0)
+    nodes, initializers, outputs = [], [], []
+    for kind, channels in (("score", 1), ("bbox", 4), ("kps", 10)):
+        for stride in (8, 16, 32):
+            name = f"{kind}_{stride}"
+            weights = rng.standard_normal((2 * channels, 3, 1, 1)) * (3.0 if kind == "score" else 0.5)
+            shape = [0, -1, channels] if batched else [-1, channels]
+            initializers += [numpy_helper.from_array(weights.astype(np.float32), f"{name}_w"),
+                             numpy_helper.from_array(np.array(shape, dtype=np.int64), f"{name}_shape")]
+            nodes += [
+                helper.make_node("AveragePool", ["input"], [f"{name}_pool"],
+                                 kernel_shape=[stride, stride], strides=[stride, stride]),
+                helper.make_node("Conv", [f"{name}_pool", f"{name}_w"], [f"{name}_conv"]),
+                helper.make_node("Sigmoid" if kind == "score" else "Abs", [f"{name}_conv"], [f"{name}_act"]),
+                helper.make_node("Transpose", [f"{name}_act"], [f"{name}_nhwc"], perm=[0, 2, 3, 1]),
+                helper.make_node("Reshape", [f"{name}_nhwc", f"{name}_shape"], [name]),
+            ]
+            outputs.append(helper.make_tensor_value_info(name, TensorProto.FLOAT, None))
+    graph = helper.make_graph(
+        nodes, "scrfd", [helper.make_tensor_value_info("input", TensorProto.FLOAT, [batch, 3, size, size])],
+        outputs, initializers
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return SCRFD(str(path))
+
+
+@pytest.mark.parametrize("batch, batched, dynamic", [
+    ("N", True, True),
+    ("N", False, True),
+    (1, False, False),
+])
+def test_batched_detection_matches_detect_faces(tmp_path, batch, batched, dynamic):
+    detector = write_detector(tmp_path / "det.onnx", batch, batched)
+    assert detector.batched == batched
+    assert recognise._has_dynamic_batch(detector) == dynamic
+    app = SimpleNamespace(det_model=detector)
+    rng = np.random.default_rng(1)
+    # Wide, tall and square frames exercise the letterboxing
+    frames = [rng.integers(0, 256, shape, dtype=np.uint8) for shape in ((48, 80, 3), (80, 48, 3), (64, 64, 3))]
+
+    batch_faces = recognise.detect_faces_batch(app, frames)
+
+    for frame, faces in zip(frames, batch_faces):
+        expected = recognise.detect_faces(app, frame)
+        assert len(faces) == len(expected) > 0
+        for face, reference in zip(faces, expected):
+            np.testing.assert_allclose(face.bbox, reference.bbox, rtol=1e-4, atol=1e-3)
+            np.testing.assert_allclose(face.kps, reference.kps, rtol=1e-4, atol=1e-3)
+            assert face.det_score == pytest.approx(reference.det_score, abs=1e-5)
+
+
+class BrokenCapture(FakeCapture):
+    def read(self):
+        raise RuntimeError("decoder crashed")
+
+
+def test_live_reader_finishes_when_capture_raises(monkeypatch):
+    monkeypatch.setattr(recognise.cv2, "VideoCapture", lambda source: BrokenCapture(100))
+    reader = recognise.LiveFrameReader("rtsp://camera/stream").start()
+
+    assert reader.read(timeout=5.0) is None
+    assert reader.finished
+    assert str(reader.error) == "decoder crashed"
+    reader.stop()
+
+
+def test_live_run_emits_events_as_they_happen(monkeypatch, tmp_path):
+    present = set(range(0, 40))
+    tool, app, _ = make_tool(monkeypatch, present, 80)
+    monkeypatch.setattr(recognise.RecogniseTool, "embed_image", lambda self, path: TARGET)
+    events = []
+    tool.on_event = events.append
+    # A local file is paced to its frame rate, so the watch sees the face leave
+    video = tmp_path / "stream.mp4"
+    video.write_bytes(b"")
+
+    result = tool._run("face.jpg", str(video), mode="live", max_duration=3.0)
+
+    assert [e['event'] for e in events] == ['start', 'end']
+    assert "Dropped frames:" in result
+    assert tool._run("face.jpg", str(video), mode="live", batch_size=4) == \
+        "batch_size is not supported in 'live' mode."
@@ -0,0 +1,242 @@
+import os
+import shutil
+import stat
+import subprocess
+
+import cv2
+import numpy as np
+import pytest
+
+from agent.tools import video_cut
+from agent.tools.video_cut import compile_highlights, merge_intervals, _copy_points
+
+FPS = 10
+BITS = 6
+
+def write_video(path, num_frames=60):
+    """Write a video whose frame i shows i in binary as black/white stripes"""
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), FPS, (16 * BITS, 48))
+    for i in range(num_frames):
+        frame = np.zeros((48, 16 * BITS, 3), dtype=np.uint8)
+        for bit in range(BITS):
+            if i >> bit & 1:
+                frame[:, 16 * bit:16 * (bit + 1)] = 255
+        out.write(frame)
+    out.release()
+
+def read_stripes(path):
+    """Return the mean level of each stripe (inner part) of every frame, in [0, 1]"""
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append([frame[8:40, 16 * bit + 4:16 * bit + 12].mean() / 255 for bit in range(BITS)])
+    cap.release()
+    return np.array(frames)
+
+def stripes(i):
+    return np.array([i >> bit & 1 for bit in range(BITS)], dtype=float)
+
+def test_merge_intervals_sorts_and_merges_across_tracks():
+    appearances = {
+        1: [{'start_time': '00:00:10', 'end_time': '00:00:15'},
+            {'start_time': '00:00:01', 'end_time': '00:00:02'}],
+        2: [{'start_time': '00:00:14', 'end_time': '00:00:20'},
+            {'start_time': '00:00:02', 'end_time': '00:00:03'}],
+    }
+    assert merge_intervals(appearances) == [(1, 3), (10, 20)]
+
+def test_merge_intervals_prefers_frame_accurate_seconds():
+    appearances = {1: [{'start_time': '00:00:01', 'end_time': '00:00:02',
+                        'start_seconds': 1.4, 'end_seconds': 2.6}]}
+    assert merge_intervals(appearances) == [(1.4, 2.6)]
+
+def gop_packets(num_frames=200, fps=25, gop=50):
+    """
+    (pts, dts, is_keyframe) packets of an H.264-like stream with 2-second GOPs and B-frames.
+
+    After each keyframe, frames come in decode order P(k+2), B(k), B(k+1), so a cut is
+    clean before frames k = 1, 4, 7, ... of a GOP and before the next keyframe.
+    """
+    order = []
+    for gop_start in range(0, num_frames, gop):
+        gop_end = min(gop_start + gop, num_frames)
+        order.append(gop_start)
+        for k in range(gop_start + 1, gop_end, 3):
+            order += [k + 2, k, k + 1] if k + 2 < gop_end else list(range(k, gop_end))
+    # Decoding runs two frames ahead of presentation
+    return sorted((pts / fps, (i - 2) / fps, pts % gop == 0) for i, pts in enumerate(order))
+
+def test_copy_points_cut_on_the_first_later_frames_dts():
+    packets = gop_packets()
+    # Frame 75 (3 s) is a clean cut: its mini-GOP starts decoding with P77 at index 75 (DTS 2.92),
+    # after every earlier frame
+    assert _copy_points(packets, [(2.0, 3.0)], 0.04) == [(2.0, pytest.approx(2.92), pytest.approx(1.0))]
+    # Up to the next keyframe, and to the end of the file
+    assert _copy_points(packets, [(0.0, 2.0), (6.0, 9.0)], 0.04) == [
+        (0.0, pytest.approx(48 / 25), pytest.approx(2.0)), (6.0, None, pytest.approx(2.0))]
+
+def test_copy_points_refuse_inexact_cuts():
+    packets = gop_packets()
+    # Not a keyframe
+    assert _copy_points(packets, [(2.0, 3.0), (5.0, 6.0)], 0.04) is None
+    # B51 and B52 are shown before frame 53 but decoded after it
+    assert _copy_points(packets, [(2.0, 2.12)], 0.04) is None
+
+@pytest.fixture
+def without_ffmpeg(monkeypatch):
+    monkeypatch.setattr(video_cut, "_ffmpeg_tools", lambda: None)
+
+APPEARANCES = {1: [{'start_time': '00:00:01', 'end_time': '00:00:02'},
+                   {'start_time': '00:00:04', 'end_time': '00:00:05'}]}
+
+def test_reel_hard_cuts_keep_every_frame(tmp_path, without_ffmpeg):
+    source = tmp_path / "source.mp4"
+    write_video(source)
+    output = tmp_path / "reel.mp4"
+
+    compile_highlights(APPEARANCES, str(source), str(output))
+
+    expected = [stripes(i) for i in list(range(10, 21)) + list(range(40, 51))]
+    np.testing.assert_allclose(read_stripes(output), expected, atol=0.1)
+    # No temp files are left next to the output
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["reel.mp4", "source.mp4"]
+
+def test_reel_crossfade_blends_the_join(tmp_path, without_ffmpeg):
+    source = tmp_path / "source.mp4"
+    write_video(source)
+    output = tmp_path / "reel.mp4"
+
+    compile_highlights(APPEARANCES, str(source), str(output), crossfade=0.3)
+
+    # The last 3 frames of the first interval are blended into the first 3 of the second
+    blended = []
+    for k in range(3):
+        alpha = (k + 1) / 4
+        blended.append((1 - alpha) * stripes(18 + k) + alpha * stripes(40 + k))
+    expected = [stripes(i) for i in range(10, 18)] + blended + [stripes(i) for i in range(43, 51)]
+    np.testing.assert_allclose(read_stripes(output), expected, atol=0.1)
+
+@pytest.fixture
+def ffmpeg_calls(monkeypatch):
+    """Stub ffmpeg/ffprobe: an 8-second H.264 + AAC source with a keyframe every 2 seconds"""
+    calls = []
+    video = {"codec_type": "video", "codec_name": "h264", "avg_frame_rate": "25/1"}
+    audio = {"codec_type": "audio", "codec_name": "aac"}
+
+    def run_tool(args):
+        # Keep the text of concat lists, which are deleted after the call
+        if "concat" in args:
+            with open(args[args.index("-i") + 1]) as f:
+                args = args + [f.read()]
+        calls.append(args)
+        return ""
+
+    monkeypatch.setattr(video_cut, "_ffmpeg_tools", lambda: ("ffmpeg", "ffprobe"))
+    monkeypatch.setattr(video_cut, "_probe_source", lambda ffprobe, path: (video, audio, gop_packets()))
+    monkeypatch.setattr(video_cut, "_run_tool", run_tool)
+    return calls
+
+def reel(tmp_path, appearances, **kwargs):
+    return compile_highlights(appearances, "source.mp4", str(tmp_path / "reel.mp4"), **kwargs)
+
+def test_reel_stream_copies_when_every_interval_cuts_exactly(tmp_path, ffmpeg_calls):
+    reel(tmp_path, {1: [{'start_time': '00:00:02', 'end_time': '00:00:03'},
+                        {'start_time': '00:00:06', 'end_time': '00:00:07'}]})
+
+    (args,) = ffmpeg_calls
+    assert "copy" in args
+    concat_list = args[-1]
+    assert "inpoint 2.0\nduration 1.0\noutpoint 2.92\n" in concat_list
+    assert "inpoint 6.0\nduration 1.0\noutpoint 6.92\n" in concat_list
+
+def test_reel_re_encodes_everything_in_one_pass_unless_all_cuts_are_exact(tmp_path, ffmpeg_calls):
+    reel(tmp_path, {1: [{'start_time': '00:00:02', 'end_time': '00:00:03'},
+                        {'start_time': '00:00:05', 'end_time': '00:00:06'}]})
+
+    (args,) = ffmpeg_calls
+    assert "-filter_complex" in args
+    assert args[args.index("-c:v") + 1] == "libx264"
+    # No intermediate files are written next to the reel
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["reel.mp4"]
+
+def stripe_indices(path):
+    return [int(sum(1 << bit for bit, level in enumerate(frame) if level > 0.5)) for frame in read_stripes(path)]
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+                    reason="needs ffmpeg and ffprobe")
+def test_reel_stream_copy_keeps_exactly_the_interval_frames(tmp_path):
+    raw = tmp_path / "raw.mp4"
+    write_video(raw)
+    # 1-second GOPs with B-frames, plus an AAC track
+    source = tmp_path / "source.mp4"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", str(raw), "-f", "lavfi", "-i", "sine=d=6",
+                    "-c:v", "libx264", "-x264-params", "keyint=10:min-keyint=10:scenecut=0:bframes=3",
+                    "-crf", "18", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", str(source)], check=True)
+    output = tmp_path / "reel.mp4"
+
+    compile_highlights({1: [{'start_time': '00:00:01', 'end_time': '00:00:02'},
+                            {'start_time': '00:00:04', 'end_time': '00:00:05'}]}, str(source), str(output))
+
+    assert stripe_indices(output) == list(range(10, 20)) + list(range(40, 50))
+    decode = subprocess.run(["ffmpeg", "-v", "warning", "-i", str(output), "-f", "null", "-"],
+                            capture_output=True, text=True)
+    assert decode.stderr == ""
+    _, audio, _ = video_cut._probe_source(shutil.which("ffprobe"), str(output))
+    assert audio is not None
+
+def test_reel_crossfade_re_encodes_in_one_pass_with_requested_codec(tmp_path, ffmpeg_calls):
+    reel(tmp_path, {1: [{'start_time': '00:00:02', 'end_time': '00:00:03'},
+                        {'start_time': '00:00:06', 'end_time': '00:00:07'}]},
+         crossfade=0.5, codec="h265", preset="fast")
+
+    (args,) = ffmpeg_calls
+    graph = args[args.index("-filter_complex") + 1]
+    assert "xfade" in graph and "acrossfade" in graph
+    assert args[args.index("-c:v") + 1] == "libx265"
+    assert args[args.index("-preset") + 1] == "fast"
+    # xfade would otherwise produce 4:4:4 output that browsers can't play
+    assert args[args.index("-pix_fmt") + 1] == "yuv420p"
+
+def test_clip_rejects_unknown_codec(tmp_path):
+    with pytest.raises(ValueError, match="H264"):
+        video_cut.create_clip("source.mp4", str(tmp_path), "00:00:01", "00:00:02", 1, 1, codec="H264")
+
+def test_tool_input_only_accepts_known_codecs():
+    args = dict(input_video_path="source.mp4", start_time="00:00:01", end_time="00:00:02",
+                track_id=1, appearance_num=1)
+    assert video_cut.VideoCutToolInput(**args, codec="h265").codec == "h265"
+    with pytest.raises(ValueError):
+        video_cut.VideoCutToolInput(**args, codec="H264")
+
+def test_clip_falls_back_to_mp4v_and_reports_ffmpeg_error(tmp_path, monkeypatch, capsys):
+    source = tmp_path / "source.mp4"
+    write_video(source)
+    monkeypatch.setattr(video_cut.shutil, "which", lambda name: "ffmpeg")
+    def failing_ffmpeg(args):
+        raise RuntimeError("ffmpeg failed: Unknown encoder 'libx265'")
+    monkeypatch.setattr(video_cut, "_run_tool", failing_ffmpeg)
+
+    clip = video_cut.create_clip(str(source), str(tmp_path / "clips"), "00:00:01", "00:00:02", 1, 1,
+                                 codec="h265")
+
+    assert "Unknown encoder 'libx265'" in capsys.readouterr().out
+    np.testing.assert_allclose(read_stripes(clip), [stripes(i) for i in range(10, 21)], atol=0.1)
+
+@pytest.fixture
+def umask_022():
+    previous = os.umask(0o022)
+    yield
+    os.umask(previous)
+
+def test_outputs_get_the_usual_file_mode(tmp_path, without_ffmpeg, umask_022):
+    source = tmp_path / "source.mp4"
+    write_video(source)
+
+    clip = video_cut.create_clip(str(source), str(tmp_path / "clips"), "00:00:01", "00:00:02", 1, 1)
+    reel = compile_highlights(APPEARANCES, str(source), str(tmp_path / "reel.mp4"))
+
+    assert stat.S_IMODE(os.stat(clip).st_mode) == 0o644
+    assert stat.S_IMODE(os.stat(reel).st_mode) == 0o644